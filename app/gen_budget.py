@@ -0,0 +1,148 @@
+# app/gen_budget.py
+import math, threading
+from collections import deque
+from typing import Optional, Dict, List, Tuple, Deque, get_args
+
+from .schemas import Difficulty, Pedagogy, Subject
+from .settings import settings
+
+# 生成长度预算：按 (model, difficulty, subject, pedagogy/solve) 统计 completion_tokens，
+# 用 p99 * (1 + margin) 作为 max_tokens，避免失控生成长时间占用连接、拉高尾延迟。
+BUDGET_MIN = settings.gen_budget_min
+BUDGET_MAX = settings.gen_budget_max
+BUDGET_MARGIN = settings.gen_budget_margin
+BUDGET_PERCENTILE = settings.gen_budget_percentile
+MIN_SAMPLES = settings.gen_budget_min_samples
+WINDOW = settings.gen_budget_window  # 每个 key 保留最近 N 条样本
+MAX_KEYS = settings.gen_budget_max_keys  # key 总数上限，防止客户端用任意组合撑爆内存
+
+# /solve 的 JSON 输出单独成一类，不和 /chat/completions 的自由文本混在一起统计
+SOLVE_MODE = "solve"
+
+# 样本不足时的冷启动预算（按模式的自然长度；路由和 snapshot 都只从这里取）
+_DEFAULT_BY_PEDAGOGY = {
+    SOLVE_MODE: settings.solve_default_max_tokens,
+    "concise": 256,
+    "direct": 384,
+    "socratic": 384,
+    "step_by_step": 768,
+    "bilingual_zh_en": 1024,
+}
+DEFAULT_BUDGET = settings.gen_budget_default
+
+Key = Tuple[str, str, str, str]
+Sample = Tuple[int, bool]  # (completion_tokens, 是否因达到 max_tokens 被截断)
+
+# 内存统计（与 security.py 的限流一样，单进程内有效）
+_samples: Dict[Key, Deque[Sample]] = {}
+_lock = threading.Lock()
+
+
+_DIFFICULTIES = set(get_args(Difficulty))
+_SUBJECTS = set(get_args(Subject))
+_MODES = set(get_args(Pedagogy)) | {SOLVE_MODE}
+
+
+def _known(value: Optional[str], allowed) -> str:
+    v = (value or "").lower()
+    return v if v in allowed else ""
+
+
+def _key(model: str, difficulty: Optional[str], subject: Optional[str], pedagogy: Optional[str]) -> Key:
+    return (
+        model or "",
+        _known(difficulty, _DIFFICULTIES),
+        _known(subject, _SUBJECTS),
+        _known(pedagogy, _MODES),
+    )
+
+
+def _percentile(values, pct: float) -> int:
+    ordered = sorted(values)
+    idx = max(0, math.ceil(pct / 100.0 * len(ordered)) - 1)
+    return ordered[idx]
+
+
+def _cold_start(pedagogy: Optional[str]) -> int:
+    fallback = _DEFAULT_BY_PEDAGOGY.get(_known(pedagogy, _MODES), DEFAULT_BUDGET)
+    return max(BUDGET_MIN, min(BUDGET_MAX, fallback))
+
+
+def record_usage(model: str, completion_tokens: Optional[int], difficulty: Optional[str] = None,
+                 subject: Optional[str] = None, pedagogy: Optional[str] = None,
+                 truncated: bool = False) -> None:
+    """记录一次生成的 completion_tokens（缺失或为 0 的用量不计入）。"""
+    if not completion_tokens or completion_tokens <= 0:
+        return
+    k = _key(model, difficulty, subject, pedagogy)
+    with _lock:
+        bucket = _samples.get(k)
+        if bucket is None:
+            if len(_samples) >= MAX_KEYS:
+                return
+            bucket = _samples[k] = deque(maxlen=WINDOW)
+        bucket.append((int(completion_tokens), bool(truncated)))
+
+
+def learned_budget(model: str, difficulty: Optional[str] = None, subject: Optional[str] = None,
+                   pedagogy: Optional[str] = None) -> Optional[int]:
+    """
+    样本足够时返回学到的预算，否则返回 None。
+    - 正常情况：p99 + margin，可以低于冷启动默认值，用来限制失控生成；
+    - 截断率超过 1 - p99：被截断的样本只是下界，不能当真实长度，直接把上限翻倍
+      （预算偏小时靠这一支自动长回来）。
+    """
+    k = _key(model, difficulty, subject, pedagogy)
+    with _lock:
+        bucket = list(_samples.get(k) or ())
+    if len(bucket) < MIN_SAMPLES:
+        return None
+    capped = [n for n, truncated in bucket if truncated]
+    if len(capped) / len(bucket) > 1.0 - BUDGET_PERCENTILE / 100.0:
+        budget = max(capped) * 2
+    else:
+        budget = math.ceil(_percentile([n for n, _ in bucket], BUDGET_PERCENTILE) * (1.0 + BUDGET_MARGIN))
+    return max(BUDGET_MIN, min(BUDGET_MAX, budget))
+
+
+def pick_max_tokens(model: str, difficulty: Optional[str] = None, subject: Optional[str] = None,
+                    pedagogy: Optional[str] = None) -> Tuple[int, bool]:
+    """
+    最终使用的 max_tokens 以及它是否来自学到的统计：
+    优先学到的预算，否则按模式给冷启动默认值。
+    """
+    learned = learned_budget(model, difficulty, subject, pedagogy)
+    if learned is not None:
+        return learned, True
+    return _cold_start(pedagogy), False
+
+
+def apply_verbosity_hint(messages: List[Dict[str, str]], max_tokens: int, learned: bool) -> List[Dict[str, str]]:
+    """只有预算来自统计时才在开头加篇幅提示（冷启动默认值不代表真实长度），各路由统一用这一条规则。"""
+    if not learned:
+        return messages
+    return [{"role": "system", "content": verbosity_hint(max_tokens)}] + messages
+
+
+def verbosity_hint(max_tokens: int) -> str:
+    """按预算生成提示词里的篇幅约束（约 0.75 词/token，留一点余量）。"""
+    words = max(20, int(max_tokens * 0.6))
+    return f"Keep the whole response under about {words} words."
+
+
+def is_truncated(finish_reason: Optional[str]) -> bool:
+    return (finish_reason or "") == "length"
+
+
+def snapshot() -> Dict[str, Dict[str, int]]:
+    """调试用：每个 key 的样本数、截断数与当前预算。"""
+    with _lock:
+        buckets = {k: list(v) for k, v in _samples.items()}
+    out = {}
+    for k, bucket in buckets.items():
+        out["|".join(k)] = {
+            "samples": len(bucket),
+            "truncated": sum(1 for _, truncated in bucket if truncated),
+            "max_tokens": pick_max_tokens(*k)[0],
+        }
+    return out
@@ -1,11 +1,10 @@
-import os, httpx, time
+import httpx, time
 
-PROVIDER_API_KEY = os.getenv("PROVIDER_API_KEY", "")
-PROVIDER_BASE_URL = os.getenv("PROVIDER_BASE_URL", "https://api.openai.com/v1")
-DEMO_MODE = os.getenv("DEMO_MODE", "true").lower() == "true"
+from . import upstream
+from .settings import settings
 
 async def chat_completion(messages, model: str, temperature: float=0.2, max_tokens: int=512):
-    if DEMO_MODE or not PROVIDER_API_KEY:
+    if settings.demo_mode or not settings.provider_api_key:
         # Deterministic mock for demo/testing
         content = "[DEMO] This is a demo explanation:\n1) Understand the question\n2) Set up and transform equations\n3) Verify the result\nFinal answer: x = 4"
         return {
@@ -14,9 +13,8 @@ async def chat_completion(messages, model: str, temperature: float=0.2, max_toke
             "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
             "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
         }
-    headers = {"Authorization": f"Bearer {PROVIDER_API_KEY}", "Content-Type": "application/json"}
     payload = {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens}
     async with httpx.AsyncClient(timeout=60.0) as client:
-        r = await client.post(f"{PROVIDER_BASE_URL}/chat/completions", json=payload, headers=headers)
+        r = await client.post(f"{settings.provider_base_url}/chat/completions", json=payload, headers=upstream.auth_headers())
         r.raise_for_status()
         return r.json()
@@ -1,6 +1,9 @@
 # app/main.py
 import os
+import time
+import asyncio
 import logging
+from contextlib import asynccontextmanager, suppress
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.utils import get_openapi
@@ -9,8 +12,63 @@ from fastapi.responses import RedirectResponse, JSONResponse
 
 from .routers import solve, chat
 from .security import api_guard
+from .settings import settings
+from . import gen_budget, upstream
 
-app = FastAPI(title="Edu LLM API (Full EN + API Key)", version="1.2.0")
+# 就绪状态：/v1/health 只表示进程活着，/v1/ready 要等预热完成
+# （/v1/ready 免鉴权，只对外暴露完成的检查项名称；详细错误只写日志）
+_readiness = {"ready": False, "checks": []}
+
+# uvicorn 默认配置只给 uvicorn.* 挂了 handler，用它保证预热日志能看到
+logger = logging.getLogger("uvicorn.error")
+
+# 正在线程里跑的上游探测；取消预热任务停不掉线程，关闭时要先等它结束再关连接池
+_probe = None
+
+
+async def _warmup():
+    global _probe
+    t0 = time.time()
+    # 1) 预生成 OpenAPI schema，避免第一个 /docs 请求现算；失败不影响业务接口，记日志后继续
+    try:
+        app.openapi()
+        _readiness["checks"].append("openapi")
+    except Exception:
+        logger.exception("WARMUP openapi schema build failed; it will be built on first request")
+
+    # 2) 预先建连并校验上游（DNS + TLS + KEY），失败则退避重试，直到成功前都不就绪
+    delay = 1.0
+    while True:
+        try:
+            _probe = asyncio.ensure_future(asyncio.to_thread(upstream.probe))
+            result = await asyncio.shield(_probe)
+            _readiness["checks"].append("upstream")
+            logger.info("WARMUP upstream probe: %s", result)
+            break
+        except Exception as e:
+            logger.warning("WARMUP upstream probe failed: %s; retrying in %.0fs", e, delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+
+    _readiness["ready"] = True
+    logger.info("WARMUP done in %sms", round((time.time() - t0) * 1000))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 预热放到后台，不阻塞端口监听；就绪前 /v1/ready 返回 503
+    task = asyncio.create_task(_warmup())
+    yield
+    task.cancel()
+    with suppress(asyncio.CancelledError):
+        await task
+    if _probe is not None:
+        with suppress(Exception):
+            await _probe  # 探测有自己的短超时（PROBE_TIMEOUT），不会拖太久
+    await upstream.close()
+
+
+app = FastAPI(title="Edu LLM API (Full EN + API Key)", version="1.2.0", lifespan=lifespan)
 
 # 1) 先加 CORS（放最外层，保证任何异常也带 CORS 头）
 app.add_middleware(
@@ -34,6 +92,15 @@ app.include_router(chat.router,  prefix="/v1", tags=["chat"])
 def health():
     return {"status": "ok", "message": "English version running"}
 
+@app.get("/v1/ready")
+def ready():
+    status_code = 200 if _readiness["ready"] else 503
+    return JSONResponse(status_code=status_code, content={
+        "status": "ready" if _readiness["ready"] else "starting",
+        "ready": _readiness["ready"],
+        "checks": list(_readiness["checks"]),
+    })
+
 @app.get("/v1/cors-check")
 def cors_check():
     return {"ok": True}
@@ -91,6 +158,11 @@ async def all_exception_handler(request: Request, exc: Exception):
 async def whoami(req: Request):
     return {
         "x_api_key_header": req.headers.get("x-api-key"),
-        "api_key_env_is_set": bool(os.getenv("API_KEY")),
+        "api_key_env_is_set": bool(settings.api_key),
     }
 
+
+# 9) 调试接口：各 (model|difficulty|subject|pedagogy) 的用量样本数与当前 max_tokens
+@app.get("/v1/gen-budget")
+def gen_budget_stats():
+    return gen_budget.snapshot()
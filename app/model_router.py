@@ -1,11 +1,11 @@
-import os
+from .settings import settings
 
 def pick_model(difficulty: str) -> str:
     diff = (difficulty or '').lower()
     if diff == 'easy':
-        return os.getenv('MODEL_EASY', 'edu-fast-32k')
+        return settings.model_easy
     if diff == 'medium':
-        return os.getenv('MODEL_MEDIUM', 'edu-reasoning-8k')
+        return settings.model_medium
     if diff == 'hard':
-        return os.getenv('MODEL_HARD', 'edu-vision-8k')
-    return os.getenv('MODEL_MEDIUM', 'edu-reasoning-8k')
+        return settings.model_hard
+    return settings.model_medium
@@ -1,30 +1,17 @@
 from __future__ import annotations
 
-import os
 import time
 import uuid
 from typing import List, Optional, Dict, Any
 
-import requests
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, Field
 
-router = APIRouter()
-
-# =========================
-# 环境变量 & 默认配置
-# =========================
-DEMO_MODE: bool = os.getenv("DEMO_MODE", "false").lower() == "true"
-
-# 真实模型：建议使用 OpenAI
-PROVIDER_API_KEY: str = os.getenv("PROVIDER_API_KEY", "")
-PROVIDER_BASE_URL: str = os.getenv("PROVIDER_BASE_URL", "https://api.openai.com/v1")
-
-# 默认文本模型（可被请求体覆盖）
-TEXT_MODEL: str = os.getenv("PROVIDER_TEXT_MODEL", "gpt-4o-mini")
-
-HTTP_TIMEOUT = int(os.getenv("HTTP_TIMEOUT", "60"))
+from .. import gen_budget, upstream
+from ..schemas import Difficulty, Pedagogy, Subject
+from ..settings import settings
 
+router = APIRouter()
 
 # =========================
 # Pydantic 模型（对齐 OpenAI Chat Completions 结构）
@@ -40,6 +27,10 @@ class ChatRequest(BaseModel):
     temperature: float = 0.7
     top_p: float = 1.0
     stream: bool = False  # 这里只实现非流式，设置 True 也按非流式处理
+    max_tokens: Optional[int] = Field(default=None, ge=1, description="上限；不传则按历史用量自适应")
+    pedagogy: Optional[Pedagogy] = Field(default=None, description="concise/step_by_step/socratic 等")
+    subject: Optional[Subject] = Field(default=None, description="学科，用于用量统计")
+    difficulty: Optional[Difficulty] = Field(default=None, description="easy/medium/hard，用于用量统计")
     extra: Dict[str, Any] = Field(default_factory=dict, description="透传字段（可选）")
 
 
@@ -60,6 +51,7 @@ class ChatResponse(BaseModel):
     created: int
     model: str
     choices: List[ChatChoice]
+    truncated: bool = False  # finish_reason == "length"：达到 max_tokens 被截断
 
 
 # =========================
@@ -98,21 +90,35 @@ def demo_completion(messages: List[ChatMessage], model: str) -> ChatResponse:
 # 转发到 OpenAI 兼容的 Chat Completions
 # =========================
 def forward_to_provider(req: ChatRequest) -> ChatResponse:
-    if not PROVIDER_API_KEY:
+    if not settings.provider_api_key:
         # 没有 KEY，则走 demo
-        return demo_completion(req.messages, req.model or TEXT_MODEL)
-
-    url = f"{PROVIDER_BASE_URL.rstrip('/')}/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {PROVIDER_API_KEY}",
-        "Content-Type": "application/json",
-    }
+        return demo_completion(req.messages, req.model or settings.text_model)
+
+    url = f"{settings.provider_base_url}/chat/completions"
+    headers = upstream.auth_headers()
+
+    model = req.model or settings.text_model
+    # 客户端显式给了上限（字段或 extra）就照用，只受 GEN_BUDGET_MAX 约束；否则用自适应预算
+    client_max = req.max_tokens or req.extra.get("max_tokens")
+    if client_max is not None and (
+        isinstance(client_max, bool) or not isinstance(client_max, int) or client_max < 1
+    ):
+        raise HTTPException(status_code=422, detail="extra.max_tokens must be a positive integer")
+    adaptive = client_max is None
+    if adaptive:
+        max_tokens, learned = gen_budget.pick_max_tokens(model, req.difficulty, req.subject, req.pedagogy)
+    else:
+        max_tokens, learned = min(client_max, gen_budget.BUDGET_MAX), False
+
+    messages = gen_budget.apply_verbosity_hint(
+        [m.model_dump() for m in req.messages], max_tokens, learned
+    )
 
     payload: Dict[str, Any] = {
-        "model": req.model or TEXT_MODEL,
+        "model": model,
         "temperature": req.temperature,
         "top_p": req.top_p,
-        "messages": [m.model_dump() for m in req.messages],
+        "messages": messages,
         # 不做流式（stream=false）
         "stream": False,
     }
@@ -120,9 +126,10 @@ def forward_to_provider(req: ChatRequest) -> ChatResponse:
     # 透传额外字段（可选）
     if req.extra:
         payload.update(req.extra)
+    payload["max_tokens"] = max_tokens
 
     try:
-        resp = requests.post(url, headers=headers, json=payload, timeout=HTTP_TIMEOUT)
+        resp = upstream.get_session().post(url, headers=headers, json=payload, timeout=settings.http_timeout)
         if resp.status_code != 200:
             raise HTTPException(status_code=resp.status_code, detail=resp.text)
 
@@ -131,11 +138,22 @@ def forward_to_provider(req: ChatRequest) -> ChatResponse:
         choice = (data.get("choices") or [{}])[0]
         msg = choice.get("message") or {}
         content = msg.get("content") or ""
+        finish_reason = choice.get("finish_reason") or "stop"
+        if adaptive:
+            # 客户端自定上限时的截断不代表该模式的自然长度，不计入统计
+            gen_budget.record_usage(
+                model,
+                (data.get("usage") or {}).get("completion_tokens"),
+                req.difficulty,
+                req.subject,
+                req.pedagogy,
+                truncated=gen_budget.is_truncated(finish_reason),
+            )
 
         return ChatResponse(
             id=data.get("id") or f"chatcmpl-{uuid.uuid4().hex[:10]}",
             created=data.get("created") or int(time.time()),
-            model=data.get("model") or (req.model or TEXT_MODEL),
+            model=data.get("model") or (req.model or settings.text_model),
             choices=[
                 ChatChoice(
                     index=0,
@@ -143,9 +161,10 @@ def forward_to_provider(req: ChatRequest) -> ChatResponse:
                         role=msg.get("role") or "assistant",
                         content=content,
                     ),
-                    finish_reason=choice.get("finish_reason") or "stop",
+                    finish_reason=finish_reason,
                 )
             ],
+            truncated=gen_budget.is_truncated(finish_reason),
         )
     except HTTPException:
         raise
@@ -154,7 +173,7 @@ def forward_to_provider(req: ChatRequest) -> ChatResponse:
         return ChatResponse(
             id=f"chatcmpl-{uuid.uuid4().hex[:10]}",
             created=int(time.time()),
-            model=req.model or TEXT_MODEL,
+            model=req.model or settings.text_model,
             choices=[
                 ChatChoice(
                     index=0,
@@ -178,10 +197,10 @@ def chat_completions(req: ChatRequest) -> ChatResponse:
     - 在 DEMO_MODE 或没有 PROVIDER_API_KEY 的情况下返回示例答案；
     - 否则转发到 PROVIDER_BASE_URL 的 /chat/completions。
     """
-    model = req.model or TEXT_MODEL
+    model = req.model or settings.text_model
 
     # DEMO: 直接返回
-    if DEMO_MODE and not PROVIDER_API_KEY:
+    if settings.demo_mode and not settings.provider_api_key:
         return demo_completion(req.messages, model)
 
     # 真实：转发给供应商
@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-import os
 import re
 import json
 import uuid
@@ -8,27 +7,13 @@ import time
 import base64
 from typing import List, Optional, Tuple, Dict, Any
 
-import requests
 from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel, Field
 
-router = APIRouter()
-
-# =========================
-# 环境变量 & 默认配置
-# =========================
-DEMO_MODE: bool = os.getenv("DEMO_MODE", "false").lower() == "true"
-
-# 真实模型：建议使用 OpenAI
-PROVIDER_API_KEY: str = os.getenv("PROVIDER_API_KEY", "")
-PROVIDER_BASE_URL: str = os.getenv("PROVIDER_BASE_URL", "https://api.openai.com/v1")
-
-# 视觉模型（图片 → 文本）
-VISION_MODEL: str = os.getenv("PROVIDER_VISION_MODEL", "gpt-4o-mini")
-# 文本模型（生成步骤/答案）
-TEXT_MODEL: str = os.getenv("PROVIDER_TEXT_MODEL", "gpt-4o-mini")
+from .. import gen_budget, upstream
+from ..settings import settings
 
-HTTP_TIMEOUT = int(os.getenv("HTTP_TIMEOUT", "60"))
+router = APIRouter()
 
 # =========================
 # Pydantic 模型
@@ -71,6 +56,7 @@ class ProblemOutput(BaseModel):
     check: Optional[str] = None
     solution: Solution = Field(default_factory=Solution)
     pedagogy_view: PedagogyView = Field(default_factory=PedagogyView)
+    truncated: bool = Field(default=False, description="生成达到 max_tokens 上限被截断")
 
 
 # =========================
@@ -96,17 +82,14 @@ def decode_data_url(data_url: str) -> Tuple[str, bytes]:
 # 调用模型：视觉 OCR（图片 → 文本）
 # =========================
 def ocr_extract_text_with_vision(image_url: str) -> str:
-    if DEMO_MODE:
+    if settings.demo_mode:
         return "[DEMO] OCR skipped: please connect a real vision model."
 
-    if not PROVIDER_API_KEY:
+    if not settings.provider_api_key:
         return "[WARN] PROVIDER_API_KEY not set — cannot OCR the image."
 
-    url = f"{PROVIDER_BASE_URL.rstrip('/')}/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {PROVIDER_API_KEY}",
-        "Content-Type": "application/json",
-    }
+    url = f"{settings.provider_base_url}/chat/completions"
+    headers = upstream.auth_headers()
 
     prompt = (
         "Extract ONLY the math/physics problem as clean plain text. "
@@ -114,7 +97,7 @@ def ocr_extract_text_with_vision(image_url: str) -> str:
     )
 
     payload = {
-        "model": VISION_MODEL,
+        "model": settings.vision_model,
         "temperature": 0,
         "messages": [
             {
@@ -128,7 +111,7 @@ def ocr_extract_text_with_vision(image_url: str) -> str:
     }
 
     try:
-        resp = requests.post(url, headers=headers, json=payload, timeout=HTTP_TIMEOUT)
+        resp = upstream.get_session().post(url, headers=headers, json=payload, timeout=settings.http_timeout)
         if resp.status_code != 200:
             return f"[OCR error] HTTP {resp.status_code}: {resp.text[:300]}"
         data = resp.json()
@@ -156,8 +139,22 @@ SOLVE_SYS_PROMPT = (
 )
 
 
-def call_text_model_to_solve(problem_text: str, difficulty: str = "medium") -> Dict[str, Any]:
-    if DEMO_MODE or not PROVIDER_API_KEY:
+def _empty_solve_out(steps: List[str], truncated: bool = False) -> Dict[str, Any]:
+    return {
+        "steps": steps,
+        "final_answer": "",
+        "hints": [],
+        "common_mistakes": [],
+        "check": "",
+        "pedagogy_view": {"socratic_questions": [], "misconceptions": []},
+        "truncated": truncated,
+    }
+
+
+def call_text_model_to_solve(
+    problem_text: str, difficulty: str = "medium", subject: Optional[str] = None
+) -> Dict[str, Any]:
+    if settings.demo_mode or not settings.provider_api_key:
         return {
             "steps": [
                 "[DEMO] This is a demo explanation:",
@@ -188,11 +185,12 @@ def call_text_model_to_solve(problem_text: str, difficulty: str = "medium") -> D
             },
         }
 
-    url = f"{PROVIDER_BASE_URL.rstrip('/')}/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {PROVIDER_API_KEY}",
-        "Content-Type": "application/json",
-    }
+    url = f"{settings.provider_base_url}/chat/completions"
+    headers = upstream.auth_headers()
+
+    max_tokens, learned = gen_budget.pick_max_tokens(
+        settings.text_model, difficulty, subject, gen_budget.SOLVE_MODE
+    )
 
     user_prompt = (
         f"Difficulty: {difficulty}\n"
@@ -201,27 +199,46 @@ def call_text_model_to_solve(problem_text: str, difficulty: str = "medium") -> D
     )
 
     payload = {
-        "model": TEXT_MODEL,
+        "model": settings.text_model,
         "temperature": 0.2,
-        "messages": [
-            {"role": "system", "content": SOLVE_SYS_PROMPT},
-            {"role": "user", "content": user_prompt},
-        ],
+        "max_tokens": max_tokens,
+        "messages": gen_budget.apply_verbosity_hint(
+            [
+                {"role": "system", "content": SOLVE_SYS_PROMPT},
+                {"role": "user", "content": user_prompt},
+            ],
+            max_tokens,
+            learned,
+        ),
         "response_format": {"type": "json_object"},
     }
 
     try:
-        resp = requests.post(url, headers=headers, json=payload, timeout=HTTP_TIMEOUT)
+        resp = upstream.get_session().post(url, headers=headers, json=payload, timeout=settings.http_timeout)
         if resp.status_code != 200:
             raise HTTPException(status_code=500, detail=f"LLM error: {resp.text[:500]}")
         data = resp.json()
-        content = (
-            data.get("choices", [{}])[0]
-            .get("message", {})
-            .get("content", "")
-            .strip()
+        choice = data.get("choices", [{}])[0]
+        content = choice.get("message", {}).get("content", "").strip()
+        truncated = gen_budget.is_truncated(choice.get("finish_reason"))
+        gen_budget.record_usage(
+            settings.text_model,
+            (data.get("usage") or {}).get("completion_tokens"),
+            difficulty,
+            subject,
+            gen_budget.SOLVE_MODE,
+            truncated=truncated,
         )
-        out = json.loads(content)
+        try:
+            out = json.loads(content)
+        except ValueError:
+            if not truncated:
+                raise
+            # 截断的 JSON 无法解析：把已生成的部分原样作为步骤返回并标记，不丢内容
+            return _empty_solve_out(
+                [f"[TRUNCATED] response hit the {max_tokens}-token limit", content], truncated=True
+            )
+        out["truncated"] = truncated
         out.setdefault("steps", [])
         out.setdefault("final_answer", "")
         out.setdefault("hints", [])
@@ -230,14 +247,7 @@ def call_text_model_to_solve(problem_text: str, difficulty: str = "medium") -> D
         out.setdefault("pedagogy_view", {"socratic_questions": [], "misconceptions": []})
         return out
     except Exception as e:
-        return {
-            "steps": ["[ERROR] text-model exception", str(e)],
-            "final_answer": "",
-            "hints": [],
-            "common_mistakes": [],
-            "check": "",
-            "pedagogy_view": {"socratic_questions": [], "misconceptions": []},
-        }
+        return _empty_solve_out(["[ERROR] text-model exception", str(e)])
 
 
 # =========================
@@ -263,7 +273,7 @@ async def solve_problem(input: ProblemInput, request: Request):
     if not problem_text:
         raise HTTPException(status_code=400, detail="No problem text. Provide text or a valid image_url.")
 
-    solve_out = call_text_model_to_solve(problem_text, difficulty=difficulty)
+    solve_out = call_text_model_to_solve(problem_text, difficulty=difficulty, subject=input.subject)
 
     pid = f"prob_{uuid.uuid4().hex[:8]}"
     normalized = NormalizedProblem(
@@ -290,6 +300,7 @@ async def solve_problem(input: ProblemInput, request: Request):
                 (solve_out.get("pedagogy_view") or {}).get("misconceptions", [])
             ),
         ),
+        truncated=bool(solve_out.get("truncated", False)),
     )
 
     _elapsed = round((time.time() - t0) * 1000)
@@ -4,6 +4,7 @@ from typing import List, Optional, Literal, Any, Dict
 GradeBand = Literal['primary','middle','high']
 Subject = Literal['math','physics','chemistry','biology','english','chinese','history','geography','cs']
 Difficulty = Literal['easy','medium','hard']
+Pedagogy = Literal['socratic','direct','step_by_step','bilingual_zh_en','concise']
 
 class ProblemInput(BaseModel):
     text: Optional[str] = Field(None, description='Problem statement (Markdown/LaTeX).')
@@ -30,7 +31,7 @@ class ChatRequest(BaseModel):
     stream: bool = False
     temperature: float = 0.3
     max_tokens: int = 512
-    pedagogy: Optional[Literal['socratic','direct','step_by_step','bilingual_zh_en','concise']] = 'step_by_step'
+    pedagogy: Optional[Pedagogy] = 'step_by_step'
     grade_band: Optional[GradeBand] = None
     subject: Optional[Subject] = None
 
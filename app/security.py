@@ -1,13 +1,12 @@
 # app/security.py
-import os, time
+import time
 from fastapi import Request, HTTPException
 
-API_KEY = os.getenv("API_KEY", "")
-RATE_LIMIT_PER_MIN = int(os.getenv("RATE_LIMIT_PER_MIN", "60"))  # req/min per IP
+from .settings import settings
 
 # 精确放行：这些路径不需要 x-api-key
 _EXEMPT_EXACT = {
-    "/", "/v1/health", "/v1/cors-check",
+    "/", "/v1/health", "/v1/ready", "/v1/cors-check",
     "/docs", "/openapi.json", "/redoc", "/favicon.ico",
 }
 
@@ -30,14 +29,14 @@ async def api_guard(request: Request):
 
     # 3) 业务接口：校验 x-api-key
     key = request.headers.get("x-api-key", "")
-    if not API_KEY or key != API_KEY:
+    if not settings.api_key or key != settings.api_key:
         raise HTTPException(status_code=401, detail="Unauthorized: invalid or missing x-api-key")
 
     # 4) 限流（按 IP / 60s 窗口）
     ip = request.client.host if request.client else "unknown"
     now = time.time()
     history = [t for t in _request_log.get(ip, []) if now - t < 60.0]
-    if len(history) >= RATE_LIMIT_PER_MIN:
+    if len(history) >= settings.rate_limit_per_min:
         raise HTTPException(status_code=429, detail="Too many requests, please slow down.")
     history.append(now)
     _request_log[ip] = history
@@ -0,0 +1,70 @@
+# app/settings.py
+import os
+from pydantic import BaseModel, ConfigDict
+
+
+# 环境变量名与字段名（大写）不一致的字段
+_ENV_NAMES = {
+    "text_model": "PROVIDER_TEXT_MODEL",
+    "vision_model": "PROVIDER_VISION_MODEL",
+}
+
+
+class Settings(BaseModel):
+    """所有环境变量只在这里读取一次，其他模块统一 `from .settings import settings`。"""
+
+    # model_easy 等字段名以 model_ 开头，关掉 pydantic 的保护命名空间告警
+    model_config = ConfigDict(protected_namespaces=())
+
+    # 服务自身
+    api_key: str = ""
+    rate_limit_per_min: int = 60  # req/min per IP
+
+    # 上游模型供应商（OpenAI 兼容）
+    demo_mode: bool = False
+    provider_api_key: str = ""
+    provider_base_url: str = "https://api.openai.com/v1"
+    provider_probe_path: str = "/models"  # 预热探测路径；本地 mock 可改成 /health，留空则只建连不校验
+    text_model: str = "gpt-4o-mini"
+    vision_model: str = "gpt-4o-mini"
+    http_timeout: int = 60
+    probe_timeout: float = 5.0  # 预热探测的连接/读取超时，与业务请求的 HTTP_TIMEOUT 分开
+    upstream_pool_size: int = 20
+
+    # 难度路由
+    model_easy: str = "edu-fast-32k"
+    model_medium: str = "edu-reasoning-8k"
+    model_hard: str = "edu-vision-8k"
+
+    # 生成长度预算（见 gen_budget.py）
+    gen_budget_min: int = 64
+    gen_budget_max: int = 2048
+    gen_budget_margin: float = 0.2
+    gen_budget_percentile: float = 99
+    gen_budget_min_samples: int = 20
+    gen_budget_window: int = 500
+    gen_budget_max_keys: int = 256
+    gen_budget_default: int = 512
+    solve_default_max_tokens: int = 2048
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        """
+        按字段名读取同名大写环境变量（个别字段见 _ENV_NAMES）；
+        没设置的变量直接用上面的字段默认值，默认值只写这一处。
+        """
+        values = {}
+        for name, field in cls.model_fields.items():
+            raw = os.getenv(_ENV_NAMES.get(name, name.upper()))
+            if raw is None:
+                continue
+            if field.annotation is bool:
+                values[name] = raw.lower() == "true"
+            elif name == "provider_base_url":
+                values[name] = raw.rstrip("/")
+            else:
+                values[name] = raw  # int/float 由 pydantic 转换
+        return cls(**values)
+
+
+settings = Settings.from_env()
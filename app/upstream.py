@@ -0,0 +1,67 @@
+# app/upstream.py
+import threading
+from typing import Optional, Dict, Any
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .settings import settings
+
+# 共享连接池：DNS 解析与 TLS 握手只在预热时付一次，之后请求复用 keep-alive 连接
+_session: Optional[requests.Session] = None
+_lock = threading.Lock()
+
+
+def auth_headers() -> Dict[str, str]:
+    return {
+        "Authorization": f"Bearer {settings.provider_api_key}",
+        "Content-Type": "application/json",
+    }
+
+
+def get_session() -> requests.Session:
+    """同步路由（solve/chat）使用的 requests 连接池。"""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                s = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=settings.upstream_pool_size,
+                )
+                s.mount("https://", adapter)
+                s.mount("http://", adapter)
+                _session = s
+    return _session
+
+
+def probe() -> Dict[str, Any]:
+    """
+    预先建立并校验到 PROVIDER_BASE_URL 的连接。
+    - 没有 PROVIDER_API_KEY：所有路由都走 demo，不访问上游，直接视为就绪；
+    - 否则 GET {PROVIDER_BASE_URL}{PROVIDER_PROBE_PATH}（默认 /models）：
+      2xx/3xx 为通过；401/403 说明 KEY 不对；404 视为连接可用（方便本地 mock 没有该路径）；
+    - PROVIDER_PROBE_PATH 为空时只请求 base URL 建连，不看状态码。
+    失败时抛出 RuntimeError。
+    """
+    if not settings.provider_api_key:
+        return {"upstream": "skipped", "reason": "PROVIDER_API_KEY not set"}
+
+    url = f"{settings.provider_base_url}{settings.provider_probe_path}"
+    timeout = (settings.probe_timeout, settings.probe_timeout)  # (connect, read)
+    resp = get_session().get(url, headers=auth_headers(), timeout=timeout)
+    if not settings.provider_probe_path:
+        return {"upstream": "connected", "status": resp.status_code}
+    if resp.status_code in (401, 403):
+        raise RuntimeError(f"upstream rejected PROVIDER_API_KEY: HTTP {resp.status_code}")
+    if resp.status_code >= 400 and resp.status_code != 404:
+        raise RuntimeError(f"upstream probe failed: HTTP {resp.status_code}: {resp.text[:200]}")
+    return {"upstream": "ok", "status": resp.status_code}
+
+
+async def close() -> None:
+    global _session
+    if _session is not None:
+        _session.close()
+        _session = None